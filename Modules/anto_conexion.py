@@ -4,35 +4,13 @@
 import pyodbc
 from datetime import datetime
 
-drivers = [
-        'ODBC Driver 17 for SQL Server',  # Preferido y más reciente
-        'SQL Server Native Client 11.0',  # Native Client version 11
-        'SQL Server Native Client 10.0',  # Native Client version 10
-        'SQL Server',  # Generic ODBC driver name (legacy)
-    ]
-
-def obtener_conexion():
-    # Configura la conexión a la base de datos SQL Server.
-    server = 'SQL01'
-    database = 'Gestion'
-
-    for driver in drivers:
-        conexion_str = (
-            f"DRIVER={{{driver}}};"
-            f"SERVER={server};"
-            f"DATABASE={database};"
-            "Trusted_Connection=yes;"
-        )
-        try:
-            print(f"Intentando conectar con el driver: {driver}")
-            conexion = pyodbc.connect(conexion_str)
-            print(f"Conexión exitosa con el driver: {driver}")
-            return conexion
-        except pyodbc.Error as error:
-            print(f"Error al intentar conectar con el driver: {driver}")
-            print(error)
-    
-    raise Exception("No se pudo conectar a la base de datos con ninguno de los drivers disponibles.")
+from Modules.conexion_db import obtener_conexion as _obtener_conexion, registrar_escritura
+
+
+def obtener_conexion(solo_lectura=False, cuil=None):
+    # Base Gestion en SQL01. Las lecturas usan la réplica con la misma
+    # lógica de respaldo al primario que Modules/conexion_db.py.
+    return _obtener_conexion(solo_lectura=solo_lectura, cuil=cuil, server='SQL01', database='Gestion')
 
 
 
@@ -76,6 +54,7 @@ def actualizar_registro(cuil, razon_social, provincia, localidad, calle, calle_n
         
         # Guarda los cambios
         conn.commit()
+        registrar_escritura(cuil)
         
         return True  # Devuelve True si la operación fue exitosa
     except pyodbc.Error as e:
@@ -92,7 +71,7 @@ def actualizar_registro(cuil, razon_social, provincia, localidad, calle, calle_n
 # anto_conexion.py
 
 def obtener_datos_por_cuil(cuil):
-    conexion = obtener_conexion()
+    conexion = obtener_conexion(solo_lectura=True, cuil=cuil)
     if conexion is None:
         print("Error: No se pudo conectar a la base de datos.")
         return None
@@ -139,7 +118,7 @@ def obtener_datos_por_cuil(cuil):
 
 
 def ejecutar_procedimiento_almacenado(cuil):
-    conexion = obtener_conexion()
+    conexion = obtener_conexion(solo_lectura=True, cuil=cuil)
     if conexion is None:
         print("Error: No se pudo conectar a la base de datos.")
         return None
@@ -231,6 +210,7 @@ def insertar_nuevo_registro(
         
         # Confirmar los cambios en la base de datos
         conexion.commit()
+        registrar_escritura(cuil)
 
         # Confirmar si realmente se insertó la fila
         if cursor.rowcount > 0:
@@ -0,0 +1,144 @@
+"""
+Búsqueda de personas por apellido y nombre (Apeynom).
+
+• En el servidor: paginado por clave (Apeynom, CUIL) con el SP
+  Anto_BuscarPersonasPorNombre, sin OFFSET.
+• En local (opcional): índice de trigramas sobre los nombres normalizados
+  (sin acentos ni mayúsculas) para búsquedas parciales.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import unicodedata
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import pyodbc
+
+from Modules.conexion_db import ConexionLimitada
+
+# (CUIL, Apeynom)
+Resultado = Tuple[str, str]
+
+_SP_BUSQUEDA = "Aportes.dbo.Anto_BuscarPersonasPorNombre"
+PAGINA_NOMBRES = 50
+_PAGINA_INDICE = 5000
+
+
+def normalizar(texto: str) -> str:
+    """Quita acentos, pasa a minúsculas y colapsa espacios."""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.casefold().split())
+
+
+def _trigramas(texto: str) -> Set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+
+
+def buscar_en_servidor(
+    cur: pyodbc.Cursor,
+    patron: str,
+    despues: Optional[Resultado] = None,
+    cantidad: int = PAGINA_NOMBRES,
+) -> List[Resultado]:
+    """
+    Devuelve hasta ``cantidad`` personas cuyo Apeynom empieza con ``patron``,
+    ordenadas por (Apeynom, CUIL) y posteriores a ``despues`` (última fila
+    de la página anterior).
+    """
+    ultimo_cuil, ultimo_nombre = despues if despues else (None, None)
+    cur.execute(
+        f"EXEC {_SP_BUSQUEDA} @Patron = ?, @UltimoApeynom = ?, @UltimoCUIL = ?, @Cantidad = ?",
+        _escapar_like(patron.strip()), ultimo_nombre, ultimo_cuil, cantidad,
+    )
+    return [(str(f.CUIL), f.Apeynom or "") for f in cur.fetchall()]
+
+
+class IndiceNombres:
+    """Índice en memoria de nombres normalizados por trigramas."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._nombres: Dict[str, str] = {}
+        self._normalizados: Dict[str, str] = {}
+        self._trigramas: Dict[str, Set[str]] = {}
+        self.listo = False
+
+    def __len__(self) -> int:
+        return len(self._nombres)
+
+    def agregar(self, cuil: str, apeynom: str) -> None:
+        norm = normalizar(apeynom)
+        with self._lock:
+            if cuil in self._nombres:
+                return
+            self._nombres[cuil] = apeynom
+            self._normalizados[cuil] = norm
+            for tri in _trigramas(norm):
+                self._trigramas.setdefault(tri, set()).add(cuil)
+
+    def buscar(
+        self,
+        consulta: str,
+        despues: Optional[Resultado] = None,
+        cantidad: int = PAGINA_NOMBRES,
+    ) -> List[Resultado]:
+        """
+        Busca cada palabra de ``consulta`` como fragmento del nombre, sin
+        distinguir acentos ni mayúsculas. Mismo paginado por clave que
+        :func:`buscar_en_servidor`.
+        """
+        norm = normalizar(consulta)
+        if not norm:
+            return []
+        partes = norm.split()
+        with self._lock:
+            # Los trigramas acotan los candidatos; los fragmentos de menos de
+            # 3 letras no tienen trigramas y se verifican solo en el filtro final
+            # (si todos son cortos se recorren todos los nombres).
+            candidatos: Optional[Set[str]] = None
+            for parte in (p for p in partes if len(p) >= 3):
+                tris = sorted(_trigramas(parte), key=lambda t: len(self._trigramas.get(t, ())))
+                encontrados = set(self._trigramas.get(tris[0], ()))
+                for tri in tris[1:]:
+                    encontrados &= self._trigramas.get(tri, set())
+                candidatos = encontrados if candidatos is None else candidatos & encontrados
+                if not candidatos:
+                    return []
+            if candidatos is None:
+                candidatos = set(self._normalizados)
+
+            clave_despues = (normalizar(despues[1]), despues[0]) if despues else None
+            filas = sorted(
+                (self._normalizados[c], c)
+                for c in candidatos
+                if all(p in self._normalizados[c] for p in partes)
+            )
+            if clave_despues:
+                filas = filas[bisect.bisect_right(filas, clave_despues):]
+            return [(c, self._nombres[c]) for _, c in filas[:cantidad]]
+
+    def construir(self, conectar: Callable[[], ConexionLimitada]) -> int:
+        """Carga todos los nombres de Personas recorriendo páginas por clave."""
+        print("[*] Construyendo índice local de nombres...")
+        conn = conectar()
+        try:
+            cur = conn.cursor()
+            ultimo: Optional[Resultado] = None
+            while True:
+                pagina = buscar_en_servidor(cur, "", ultimo, _PAGINA_INDICE)
+                for cuil, nombre in pagina:
+                    self.agregar(cuil, nombre)
+                if len(pagina) < _PAGINA_INDICE:
+                    break
+                ultimo = pagina[-1]
+        finally:
+            conn.close()
+        self.listo = True
+        print(f"[+] Índice local listo: {len(self)} nombres.")
+        return len(self)
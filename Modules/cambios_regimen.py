@@ -0,0 +1,151 @@
+"""
+Aviso de cambios de régimen hechos por otros usuarios.
+
+Un hilo en segundo plano consulta el Change Tracking de SQL Server sobre
+WS_SELECCION_REGIMEN y trae solo los CUIL modificados desde la última
+versión leída, en lugar de volver a consultar cada CUIL. Si Change Tracking
+no está habilitado el hilo se detiene; ante errores espera cada vez más.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import pyodbc
+
+from Modules.conexion_db import ConexionLimitada, obtener_conexion
+from Modules.operaciones_regimen import leer_regimenes
+
+Conectar = Callable[..., ConexionLimitada]
+
+_TABLA = "dbo.WS_SELECCION_REGIMEN"
+_SP_CAMBIOS = "Aportes.dbo.Anto_CambiosRegimen"
+# Tope de la espera entre reintentos tras errores (segundos)
+_ESPERA_MAXIMA_SEG = 300
+# La conexión se renueva cada tanto para que vuelva a pasar por el control
+# de retraso de la réplica (segundos).
+_RECONECTAR_SEG = 60
+
+
+class SondeoCambios:
+    """
+    Sondea los cambios cada ``intervalo`` segundos y llama a ``al_cambiar``
+    con ``{CUIL: REGIMEN}`` (``None`` si la fila se borró). ``cache`` guarda
+    el régimen de los CUIL observados y se actualiza en el lugar.
+    """
+
+    def __init__(
+        self,
+        al_cambiar: Callable[[Dict[str, Optional[int]]], None],
+        intervalo: float = 5.0,
+        conectar: Conectar = obtener_conexion,
+    ) -> None:
+        self.al_cambiar = al_cambiar
+        self.intervalo = intervalo
+        self.conectar = conectar
+        self.cache: Dict[str, Optional[int]] = {}
+        self.version: Optional[int] = None
+        self.disponible = True
+        self._conn: Optional[ConexionLimitada] = None
+        self._conectado = 0.0
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    # ───────── Ciclo de vida ─────────
+    def iniciar(self) -> None:
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=self.intervalo + 5)
+            self._hilo = None
+        self._cerrar()
+
+    def observar(self, cuil: str, regimen: Optional[int]) -> None:
+        """Registra el régimen leído de un CUIL para mantenerlo al día."""
+        with self._lock:
+            self.cache[cuil] = regimen
+
+    def _ciclo(self) -> None:
+        espera = self.intervalo
+        while not self._detener.wait(espera):
+            try:
+                cambios = self.sondear()
+            except (pyodbc.Error, ConnectionError) as e:
+                espera = min(espera * 2, _ESPERA_MAXIMA_SEG)
+                print(f"[!] Error al consultar cambios de régimen: {e}. Próximo intento en {espera:.0f}s.")
+                self._cerrar()
+                continue
+            espera = self.intervalo
+            if not self.disponible:
+                print(f"[!] Change Tracking no está habilitado en {_TABLA}: se desactiva el aviso de cambios.")
+                self._cerrar()
+                return
+            if cambios:
+                self.al_cambiar(cambios)
+
+    def _cerrar(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception as e:
+                print(f"[!] Error al cerrar la conexión: {e}")
+            self._conn = None
+
+    # ───────── Consultas ─────────
+    def sondear(self) -> Dict[str, Optional[int]]:
+        """
+        Trae los cambios desde la última versión y actualiza ``cache``. Si
+        Change Tracking no está habilitado pone ``disponible`` en False.
+        """
+        if self._conn is not None and time.monotonic() - self._conectado > _RECONECTAR_SEG:
+            self._cerrar()
+        if self._conn is None:
+            self._conn = self.conectar(solo_lectura=True)
+            self._conectado = time.monotonic()
+            # Sin autocommit la primera consulta deja abierta una transacción y,
+            # en un secundario (instantánea), cada sondeo leería los mismos datos.
+            self._conn.autocommit = True
+        cur = self._conn.cursor()
+
+        # La versión actual se toma antes de leer los cambios y pasa a ser la
+        # base del próximo sondeo, aunque no haya filas nuevas.
+        cur.execute(
+            "SELECT CHANGE_TRACKING_CURRENT_VERSION(), "
+            f"CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('{_TABLA}'))"
+        )
+        actual, minima = cur.fetchone()
+        if actual is None:
+            # CHANGE_TRACKING_CURRENT_VERSION() es NULL sin Change Tracking en la base
+            self.disponible = False
+            return {}
+        actual = int(actual)
+        if self.version is None:
+            self.version = actual
+            return {}
+
+        if minima is not None and self.version < int(minima):
+            # Se depuraron cambios que no llegamos a leer: recarga lo observado
+            print("[!] Versión de Change Tracking vencida. Recargando CUIL observados...")
+            with self._lock:
+                observados = list(self.cache)
+            actuales = leer_regimenes(cur, observados)
+            cambios = {c: actuales.get(c) for c in observados}
+        else:
+            cur.execute(f"EXEC {_SP_CAMBIOS} @UltimaVersion = ?", self.version)
+            cambios = {
+                str(fila.CUIL): int(fila.REGIMEN) if fila.REGIMEN is not None else None
+                for fila in cur.fetchall()
+            }
+        self.version = actual
+
+        with self._lock:
+            for cuil, regimen in cambios.items():
+                if cuil in self.cache:
+                    self.cache[cuil] = regimen
+        return cambios
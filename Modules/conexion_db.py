@@ -2,59 +2,408 @@
 Módulo de conexión a SQL Server.
 Intenta varios drivers ODBC y devuelve una conexión abierta o lanza
 una excepción si ninguno funciona.
+
+Las consultas de solo lectura pueden dirigirse a una réplica
+(``solo_lectura=True``); las escrituras van siempre al primario.
 """
 from __future__ import annotations
 
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
 import pyodbc
 
+# Pooling del administrador ODBC: cada cadena de conexión distinta
+# (primario / réplica) mantiene su propio pool.
+pyodbc.pooling = True
+
 # Drivers más comunes en Windows
 _DRIVERS = [
+    "ODBC Driver 17 for SQL Server",
     "SQL Server Native Client 11.0",
     "SQL Server Native Client 10.0",
     "SQL Server",
 ]
+# Estos drivers ignoran ApplicationIntent: con ellos no se llega a la réplica
+_DRIVERS_SIN_INTENCION = {"SQL Server Native Client 10.0", "SQL Server"}
 
 # Ajusta aquí tu servidor y base de datos
 _SERVER = "SQL01"
 _DATABASE = "Aportes"
 
+# Réplica para lecturas. Con None se usa _SERVER con ApplicationIntent=ReadOnly
+# (el listener del Availability Group enruta a un secundario legible).
+_SERVER_LECTURA: Optional[str] = None
+# SP firmado que mide el retraso de los secundarios (los DMV de HADR piden
+# VIEW SERVER STATE, que los empleados no tienen).
+_SP_RETRASO = "Aportes.dbo.Anto_RetrasoReplica"
+# Retraso máximo tolerado en la réplica antes de leer del primario (segundos).
+_RETRASO_MAXIMO_SEG = 30
+# Cada cuánto se vuelve a medir el retraso de la réplica (segundos).
+_INTERVALO_RETRASO_SEG = 10
+# Tiempo que se deja de intentar la réplica después de una falla (segundos).
+_PAUSA_REPLICA_SEG = 60
+# Ventana en la que un CUIL recién guardado se lee del primario (segundos).
+_VENTANA_LECTURA_PROPIA_SEG = 120
+
+# Límite de conexiones abiertas a la vez en este proceso y cuánto esperar
+# por un lugar libre antes de fallar (segundos).
+_MAX_CONEXIONES = 10
+_ESPERA_POOL_SEG = 10.0
+# Timeout de login y de cada consulta (segundos; 0 = sin límite de consulta).
+_TIMEOUT_CONEXION_SEG = 5
+_TIMEOUT_CONSULTA_SEG = 30
+# Timeout de login a la réplica: si no responde rápido se usa el primario.
+_TIMEOUT_CONEXION_REPLICA_SEG = 2
+# Función que abre la conexión ODBC; la prueba de carga la reemplaza.
+_CONECTOR: Callable[..., pyodbc.Connection] = pyodbc.connect
+
+
+
+class _Estado:
+    """Estado de conexión de un proceso: cada GestorRegimen.exe tiene el suyo."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.cupo = threading.BoundedSemaphore(_MAX_CONEXIONES)
+        # Estado por endpoint de lectura (servidor, base)
+        self.replica_suspendida_hasta: Dict[Tuple[str, str], float] = {}
+        self.retraso_medido: Dict[Tuple[str, str], Tuple[float, Optional[float]]] = {}
+        self.escrituras_recientes: Dict[str, float] = {}
+        self.driver_ok: Dict[Tuple[str, str, bool], str] = {}
+        self.retraso_sin_medir: Set[Tuple[str, str]] = set()
+        # Réplicas que respondieron desde la última suspensión. Mientras una no
+        # está confirmada, un solo hilo la prueba y el resto lee del primario.
+        self.replica_confirmada: Set[Tuple[str, str]] = set()
+        self.replica_en_prueba: Set[Tuple[str, str]] = set()
+
+
+_estado_proceso = _Estado()
+_estado_hilo = threading.local()
+
+
+def _estado() -> _Estado:
+    return getattr(_estado_hilo, "estado", None) or _estado_proceso
 
-def obtener_conexion() -> pyodbc.Connection:
+
+def aislar_hilo() -> None:
     """
-    Devuelve una conexión a SQL Server usando autenticación integrada
-    de Windows (Trusted_Connection=yes).
+    Da al hilo actual su propio estado de conexión (límite, réplica, retraso y
+    escrituras propias), como si fuera otro proceso. La prueba de carga lo usa
+    para que cada empleado virtual se comporte como su propio GestorRegimen.exe.
     """
-    print("\n" + "="*25 + " OBTENIENDO CONEXIÓN " + "="*25)
-    # Mostrar drivers ODBC disponibles en el sistema
-    try:
-        available_drivers = pyodbc.drivers()
-        print("[INFO] Drivers ODBC detectados en el sistema:")
-        for drv in available_drivers:
-            print(f"    - {drv}")
-    except Exception as e:
-        print(f"[!] No se pudo obtener la lista de drivers ODBC. Error: {e}")
-    for driver in _DRIVERS:
+    _estado_hilo.estado = _Estado()
+
+
+def configurar(
+    max_conexiones: Optional[int] = None,
+    espera_pool: Optional[float] = None,
+    timeout_conexion: Optional[int] = None,
+    timeout_consulta: Optional[int] = None,
+    timeout_replica: Optional[int] = None,
+    conector: Optional[Callable[..., pyodbc.Connection]] = None,
+) -> None:
+    """Cambia los límites de conexión y reinicia el estado de ruteo a la réplica."""
+    global _MAX_CONEXIONES, _ESPERA_POOL_SEG, _TIMEOUT_CONEXION_SEG, _TIMEOUT_CONSULTA_SEG
+    global _TIMEOUT_CONEXION_REPLICA_SEG
+    global _CONECTOR, _estado_proceso
+    if max_conexiones is not None:
+        _MAX_CONEXIONES = max_conexiones
+    if espera_pool is not None:
+        _ESPERA_POOL_SEG = espera_pool
+    if timeout_conexion is not None:
+        _TIMEOUT_CONEXION_SEG = timeout_conexion
+    if timeout_consulta is not None:
+        _TIMEOUT_CONSULTA_SEG = timeout_consulta
+    if timeout_replica is not None:
+        _TIMEOUT_CONEXION_REPLICA_SEG = timeout_replica
+    if conector is not None:
+        _CONECTOR = conector
+    _estado_proceso = _Estado()
+
+
+class ConexionLimitada:
+    """
+    Conexión que libera su lugar en ``_MAX_CONEXIONES`` al cerrarse. Delega
+    todo lo demás en la ``pyodbc.Connection`` real (``conexion``); como esta,
+    en un ``with`` hace commit o rollback al salir, y además se cierra.
+    """
+
+    def __init__(self, conn: pyodbc.Connection, cupo: threading.BoundedSemaphore) -> None:
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_cupo", cupo)
+        object.__setattr__(self, "_cerrada", False)
+
+    @property
+    def conexion(self) -> pyodbc.Connection:
+        return self._conn
+
+    def __getattr__(self, nombre: str) -> Any:
+        return getattr(self._conn, nombre)
+
+    def __setattr__(self, nombre: str, valor: Any) -> None:
+        setattr(self._conn, nombre, valor)
+
+    def close(self) -> None:
+        if self._cerrada:
+            return
+        object.__setattr__(self, "_cerrada", True)
+        try:
+            self._conn.close()
+        finally:
+            self._cupo.release()
+
+    def __enter__(self) -> "ConexionLimitada":
+        return self
+
+    def __exit__(self, tipo, valor, traza) -> None:
+        try:
+            self._conn.__exit__(tipo, valor, traza)
+        finally:
+            self.close()
+
+    def __del__(self) -> None:
+        if not self._cerrada:
+            object.__setattr__(self, "_cerrada", True)
+            self._cupo.release()
+
+
+def registrar_escritura(cuil: str) -> None:
+    """
+    Marca un CUIL como recién escrito para que las próximas lecturas
+    se hagan en el primario (read-your-writes).
+    """
+    estado = _estado()
+    with estado.lock:
+        estado.escrituras_recientes[cuil] = time.monotonic()
+
+
+def _lectura_propia_pendiente(cuil: Optional[str]) -> bool:
+    if not cuil:
+        return False
+    ahora = time.monotonic()
+    estado = _estado()
+    with estado.lock:
+        # Limpia las marcas vencidas
+        for clave, momento in list(estado.escrituras_recientes.items()):
+            if ahora - momento > _VENTANA_LECTURA_PROPIA_SEG:
+                del estado.escrituras_recientes[clave]
+        return cuil in estado.escrituras_recientes
+
+
+def _suspender_replica(endpoint: Tuple[str, str], motivo: str) -> None:
+    print(f"[!] Réplica {endpoint[0]}/{endpoint[1]} suspendida por {_PAUSA_REPLICA_SEG}s: {motivo}")
+    estado = _estado()
+    with estado.lock:
+        estado.replica_suspendida_hasta[endpoint] = time.monotonic() + _PAUSA_REPLICA_SEG
+        estado.replica_confirmada.discard(endpoint)
+
+
+def _replica_disponible(endpoint: Tuple[str, str]) -> bool:
+    estado = _estado()
+    with estado.lock:
+        return time.monotonic() >= estado.replica_suspendida_hasta.get(endpoint, 0.0)
+
+
+def _tomar_prueba_replica(endpoint: Tuple[str, str]) -> bool:
+    """
+    True si este hilo puede usar la réplica: ya está confirmada o nadie más
+    la está probando. Si no, conviene leer del primario en lugar de esperar
+    el mismo timeout.
+    """
+    estado = _estado()
+    with estado.lock:
+        if endpoint in estado.replica_confirmada:
+            return True
+        if endpoint in estado.replica_en_prueba:
+            print("[INFO] Otro hilo está probando la réplica: se lee del primario.")
+            return False
+        estado.replica_en_prueba.add(endpoint)
+        return True
+
+
+def _soltar_prueba_replica(endpoint: Tuple[str, str], confirmada: bool) -> None:
+    estado = _estado()
+    with estado.lock:
+        estado.replica_en_prueba.discard(endpoint)
+        if confirmada:
+            estado.replica_confirmada.add(endpoint)
+
+
+def _conectar(server: str, database: str, solo_lectura: bool) -> pyodbc.Connection:
+    """Recorre los drivers hasta lograr una conexión al endpoint pedido."""
+    drivers = _DRIVERS
+    if solo_lectura and _SERVER_LECTURA is None:
+        # Sin ApplicationIntent el listener manda la conexión al primario
+        drivers = [d for d in _DRIVERS if d not in _DRIVERS_SIN_INTENCION]
+        if not drivers:
+            raise ConnectionError("Ningún driver configurado admite ApplicationIntent=ReadOnly.")
+    clave = (server, database, solo_lectura)
+    driver_ok = _estado().driver_ok
+    if solo_lectura and clave in driver_ok:
+        # En la réplica solo se reintenta el driver que ya funcionó: recorrer
+        # todos multiplica la espera cuando está caída.
+        drivers = [driver_ok[clave]]
+    else:
+        # Primero el driver que ya funcionó para este endpoint
+        drivers = sorted(drivers, key=lambda d: d != driver_ok.get(clave))
+    timeout = _TIMEOUT_CONEXION_REPLICA_SEG if solo_lectura else _TIMEOUT_CONEXION_SEG
+    for driver in drivers:
         conn_str = (
             f"DRIVER={{{driver}}};"
-            f"SERVER={_SERVER};"
-            f"DATABASE={_DATABASE};"
+            f"SERVER={server};"
+            f"DATABASE={database};"
             "Trusted_Connection=yes;"
         )
+        if solo_lectura:
+            conn_str += "ApplicationIntent=ReadOnly;"
         try:
-            print(f"[*] Intentando conectar con driver: '{driver}'...")
-            conn = pyodbc.connect(conn_str, timeout=5)
+            print(f"[*] Intentando conectar con driver: '{driver}' ({server})...")
+            conn = _CONECTOR(conn_str, timeout=timeout)
+            conn.timeout = _TIMEOUT_CONSULTA_SEG
             print(f"[+] Conexión exitosa con '{driver}'.")
-            print("="*72 + "\n")
+            driver_ok[clave] = driver
             return conn
         except pyodbc.Error as e:
             # Prueba con el siguiente driver
             print(f"[!] Falló la conexión con '{driver}'. Error: {e}")
             continue
 
-    print("[X]"*24)
-    print("!!! NO SE PUDO ESTABLECER CONEXIÓN CON SQL SERVER !!!")
-    print("[X]"*24 + "\n")
     raise ConnectionError(
-        "❌ No se pudo establecer conexión con SQL Server. "
+        f"❌ No se pudo establecer conexión con SQL Server ({server}). "
         "Verifica drivers instalados y credenciales."
     )
+
+
+def _avisar_sin_retraso(endpoint: Tuple[str, str], motivo: str) -> None:
+    """Avisa una sola vez por endpoint que la réplica se usa sin control de retraso."""
+    estado = _estado()
+    with estado.lock:
+        if endpoint in estado.retraso_sin_medir:
+            return
+        estado.retraso_sin_medir.add(endpoint)
+    print(
+        f"[!] No se puede medir el retraso de la réplica de {endpoint[0]}/{endpoint[1]} ({motivo}). "
+        "Se usa sin control de retraso."
+    )
+
+
+def _medir_retraso(server: str, database: str) -> Optional[float]:
+    """
+    Segundos que la réplica más atrasada está detrás del primario, según
+    ``_SP_RETRASO`` ejecutado en el primario. Devuelve None si no se puede
+    determinar (SP sin desplegar, sin permisos o base fuera de un AG).
+    """
+    try:
+        conn = _conectar(server, database, solo_lectura=False)
+    except ConnectionError:
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute(f"EXEC {_SP_RETRASO} @Base = ?", database)
+        fila = cur.fetchone()
+    except pyodbc.Error as e:
+        _avisar_sin_retraso((server, database), f"{_SP_RETRASO}: {e}")
+        return None
+    finally:
+        conn.close()
+    if fila is None or fila[0] is None:
+        _avisar_sin_retraso((server, database), "la base no está en un Availability Group")
+        return None
+    return max(0.0, float(fila[0]))
+
+
+def _retraso_replica(server: str, database: str) -> Optional[float]:
+    """Retraso de la réplica, medido como mucho cada ``_INTERVALO_RETRASO_SEG``."""
+    endpoint = (server, database)
+    ahora = time.monotonic()
+    estado = _estado()
+    with estado.lock:
+        medido = estado.retraso_medido.get(endpoint)
+    if medido is not None and ahora - medido[0] < _INTERVALO_RETRASO_SEG:
+        return medido[1]
+    retraso = _medir_retraso(server, database)
+    with estado.lock:
+        estado.retraso_medido[endpoint] = (ahora, retraso)
+    return retraso
+
+
+def obtener_conexion(
+    solo_lectura: bool = False,
+    cuil: Optional[str] = None,
+    server: Optional[str] = None,
+    database: Optional[str] = None,
+) -> ConexionLimitada:
+    """
+    Devuelve una conexión a SQL Server usando autenticación integrada
+    de Windows (Trusted_Connection=yes).
+
+    Con ``solo_lectura=True`` intenta la réplica de lectura y vuelve al
+    primario si está caída, atrasada o si ``cuil`` se guardó recientemente.
+    ``server`` y ``database`` permiten usar otra base (por defecto SQL01/Aportes).
+    """
+    server = server or _SERVER
+    database = database or _DATABASE
+    print("\n" + "="*25 + " OBTENIENDO CONEXIÓN " + "="*25)
+    # Mostrar drivers ODBC disponibles en el sistema
+    try:
+        available_drivers = pyodbc.drivers()
+        print("[INFO] Drivers ODBC detectados en el sistema:")
+        for drv in available_drivers:
+            print(f"    - {drv}")
+    except Exception as e:
+        print(f"[!] No se pudo obtener la lista de drivers ODBC. Error: {e}")
+
+    cupo = _estado().cupo
+    if not cupo.acquire(timeout=_ESPERA_POOL_SEG):
+        raise ConnectionError(
+            f"❌ Tiempo de espera agotado: ya hay {_MAX_CONEXIONES} conexiones abiertas."
+        )
+    try:
+        conn = _elegir_conexion(solo_lectura, cuil, server, database)
+    except BaseException:
+        cupo.release()
+        raise
+    return ConexionLimitada(conn, cupo)
+
+
+def _elegir_conexion(
+    solo_lectura: bool,
+    cuil: Optional[str],
+    server: str,
+    database: str,
+) -> pyodbc.Connection:
+    """Réplica o primario según disponibilidad, retraso y escrituras recientes."""
+    if solo_lectura:
+        servidor_lectura = _SERVER_LECTURA if server == _SERVER and _SERVER_LECTURA else server
+        endpoint = (servidor_lectura, database)
+        if _lectura_propia_pendiente(cuil):
+            print(f"[INFO] CUIL {cuil} guardado recientemente: se lee del primario.")
+        elif _replica_disponible(endpoint) and _tomar_prueba_replica(endpoint):
+            confirmada = False
+            try:
+                retraso = _retraso_replica(server, database)
+                if retraso is not None and retraso > _RETRASO_MAXIMO_SEG:
+                    _suspender_replica(endpoint, f"retraso de {retraso:.0f}s")
+                else:
+                    try:
+                        conn = _conectar(servidor_lectura, database, solo_lectura=True)
+                        confirmada = True
+                        print("[+] Usando réplica de lectura.")
+                        print("="*72 + "\n")
+                        return conn
+                    except ConnectionError as e:
+                        _suspender_replica(endpoint, str(e))
+            finally:
+                _soltar_prueba_replica(endpoint, confirmada)
+
+    try:
+        conn = _conectar(server, database, solo_lectura=False)
+    except ConnectionError:
+        print("[X]"*24)
+        print("!!! NO SE PUDO ESTABLECER CONEXIÓN CON SQL SERVER !!!")
+        print("[X]"*24 + "\n")
+        raise
+    print("="*72 + "\n")
+    return conn
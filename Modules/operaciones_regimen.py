@@ -0,0 +1,173 @@
+"""
+Consultas y cambios de régimen sin interfaz gráfica.
+
+``MainWindow`` y la prueba de carga usan estas mismas funciones. ``conectar``
+tiene la firma de :func:`Modules.conexion_db.obtener_conexion` y permite
+reemplazar la base real por un backend simulado.
+"""
+from __future__ import annotations
+
+import csv
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import pyodbc
+
+from Modules.conexion_db import ConexionLimitada, obtener_conexion, registrar_escritura
+
+Conectar = Callable[..., ConexionLimitada]
+
+SP_PERSONA = "Aportes.dbo.Anto_ObtenerPersonaPorCUIL"
+SP_REGIMEN = "Aportes.dbo.anto_regimenactual"
+SP_CAMBIO = "Aportes.dbo.Anto_CambiarRegimen"
+SP_REGIMENES = "Aportes.dbo.Anto_RegimenesPorCUIL"
+_LOTE_CUILS = 5000  # CUIL por llamada a SP_REGIMENES
+
+
+class VistaPrevia(NamedTuple):
+    """Resultado de comparar los cambios pedidos con el REGIMEN actual."""
+    a_cambiar: Dict[str, Tuple[Optional[int], int]]  # CUIL -> (actual, nuevo)
+    sin_cambios: List[str]
+    no_encontrados: List[str]
+
+    def resumen(self) -> str:
+        return (
+            f"A cambiar: {len(self.a_cambiar)}\n"
+            f"Ya correctos: {len(self.sin_cambios)}\n"
+            f"No encontrados: {len(self.no_encontrados)}"
+        )
+
+
+def consultar_persona(cuil: str, conectar: Conectar = obtener_conexion) -> Dict[str, Any]:
+    """
+    Ejecuta los SP de datos personales y régimen actual.
+    Devuelve ``encontrado``, ``apeynom``, ``fec_nac`` y ``regimen`` (None si no hay).
+    """
+    conn: Optional[ConexionLimitada] = None
+    try:
+        print("[*] Obteniendo conexión de lectura a la base de datos...")
+        conn = conectar(solo_lectura=True, cuil=cuil)
+        cur = conn.cursor()
+
+        # Datos personales
+        print(f"[*] Ejecutando SP de datos personales: {SP_PERSONA} con CUIL: {cuil}")
+        cur.execute(f"EXEC {SP_PERSONA} @CUIL = ?", cuil)
+        p = cur.fetchone()
+        print(f"[*] Resultado SP datos personales: {'Encontrado' if p else 'No encontrado'}")
+
+        # Régimen actual
+        print(f"[*] Ejecutando SP de régimen actual: {SP_REGIMEN} con CUIL: {cuil}")
+        cur.execute(f"EXEC {SP_REGIMEN} @CUIL = ?", cuil)
+        r = cur.fetchone()
+        print(f"[*] Resultado SP régimen: {'Encontrado' if r else 'No encontrado'}")
+
+        regimen = getattr(r, "REGIMEN", None) if r else None
+        return {
+            "encontrado": p is not None,
+            "apeynom": getattr(p, "Apeynom", "") if p else "",
+            "fec_nac": getattr(p, "Fec_nac", None) if p else None,
+            "regimen": int(regimen) if regimen is not None else None,
+        }
+    finally:
+        if conn is not None:
+            try:
+                print("[*] Cerrando conexión a la base de datos.")
+                conn.close()
+            except Exception as e:
+                print(f"[!] Error al cerrar la conexión: {e}")
+
+
+def leer_regimenes(cur: pyodbc.Cursor, cuils: Iterable[str]) -> Dict[str, Optional[int]]:
+    """REGIMEN actual de cada CUIL existente, con una llamada a SP_REGIMENES por lote."""
+    pendientes = list(dict.fromkeys(cuils))
+    regimenes: Dict[str, Optional[int]] = {}
+    for i in range(0, len(pendientes), _LOTE_CUILS):
+        lote = pendientes[i:i + _LOTE_CUILS]
+        cur.execute(f"EXEC {SP_REGIMENES} @CUILS = ?", ",".join(lote))
+        for fila in cur.fetchall():
+            regimenes[str(fila.CUIL)] = int(fila.REGIMEN) if fila.REGIMEN is not None else None
+    return regimenes
+
+
+def previsualizar_cambios(cambios: Dict[str, int], conectar: Conectar = obtener_conexion) -> VistaPrevia:
+    """
+    Compara ``{CUIL: nuevo régimen}`` con los valores actuales del primario
+    y separa los cambios reales de los que ya están correctos o no existen.
+    """
+    conn: Optional[ConexionLimitada] = None
+    try:
+        print(f"[*] Previsualizando {len(cambios)} cambio(s) de régimen...")
+        conn = conectar()
+        actuales = leer_regimenes(conn.cursor(), cambios)
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"[!] Error al cerrar la conexión: {e}")
+
+    vista = VistaPrevia({}, [], [])
+    for cuil, nuevo in cambios.items():
+        if cuil not in actuales:
+            vista.no_encontrados.append(cuil)
+        elif actuales[cuil] == nuevo:
+            vista.sin_cambios.append(cuil)
+        else:
+            vista.a_cambiar[cuil] = (actuales[cuil], nuevo)
+    print("[*] " + vista.resumen().replace("\n", " | "))
+    return vista
+
+
+def aplicar_cambios(vista: VistaPrevia, conectar: Conectar = obtener_conexion) -> int:
+    """Ejecuta solo los cambios reales de ``vista`` en una única transacción."""
+    if not vista.a_cambiar:
+        print("[*] No hay cambios reales para aplicar.")
+        return 0
+    conn: Optional[ConexionLimitada] = None
+    try:
+        conn = conectar()
+        cur = conn.cursor()
+        print(f"[*] Ejecutando {SP_CAMBIO} para {len(vista.a_cambiar)} CUIL...")
+        cur.executemany(
+            f"EXEC {SP_CAMBIO} @CUIL = ?, @NuevoRegimen = ?",
+            [(cuil, nuevo) for cuil, (_, nuevo) in vista.a_cambiar.items()],
+        )
+        conn.commit()
+        for cuil in vista.a_cambiar:
+            registrar_escritura(cuil)
+        print("[+] Commit realizado con éxito.")
+        return len(vista.a_cambiar)
+    except Exception:
+        if conn is not None:
+            try:
+                conn.rollback()
+            except Exception as e:
+                # Si se cayó el enlace el rollback también falla: vale el error original
+                print(f"[!] Error al hacer rollback: {e}")
+        raise
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"[!] Error al cerrar la conexión: {e}")
+
+
+def leer_archivo_cambios(ruta: str, validos: Iterable[int]) -> Tuple[Dict[str, int], List[str]]:
+    """
+    Lee un CSV ``CUIL;REGIMEN`` (o separado por comas). Devuelve los cambios
+    válidos y la lista de líneas descartadas. Si un CUIL se repite, gana la última.
+    """
+    regimenes = set(validos)
+    cambios: Dict[str, int] = {}
+    descartadas: List[str] = []
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        for nro, fila in enumerate(csv.reader(f.read().replace(";", ",").splitlines()), start=1):
+            if not fila or not "".join(fila).strip():
+                continue
+            cuil = fila[0].strip().replace("-", "")
+            regimen = fila[1].strip() if len(fila) > 1 else ""
+            if cuil.isdigit() and len(cuil) == 11 and regimen.isdigit() and int(regimen) in regimenes:
+                cambios[cuil] = int(regimen)
+            elif nro > 1:  # la primera línea puede ser el encabezado
+                descartadas.append(f"Línea {nro}: {';'.join(fila)}")
+    return cambios, descartadas
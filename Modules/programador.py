@@ -0,0 +1,416 @@
+"""
+Cambios de régimen programados con fecha de vigencia.
+
+Los cambios se guardan en una cola local (SQLite) y se aplican en lotes
+fuera del horario de oficina, reutilizando la previsualización para no
+escribir los que ya están correctos. Cada pasada guarda su informe en la
+misma base para consultarlo desde la aplicación. Se corre como tarea
+programada de Windows:
+
+    GestorRegimen.exe --aplicar-programados            # respeta la ventana horaria
+    python -m Modules.programador --forzar             # aplica ya lo vencido
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import date, datetime, time as dtime, timedelta
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import pyodbc
+
+from Modules.conexion_db import obtener_conexion
+from Modules.operaciones_regimen import Conectar, aplicar_cambios, previsualizar_cambios
+
+# Ventana fuera de horario pico (puede cruzar la medianoche)
+VENTANA_INICIO = dtime(21, 0)
+VENTANA_FIN = dtime(6, 0)
+_TAMANIO_LOTE = 500
+_MAX_INTENTOS = 5
+_ESPERA_REINTENTO_MIN = 15  # se duplica en cada intento fallido
+# Pausa entre pasadas de la tarea programada mientras queden vencidos
+_INTERVALO_PASADA_SEG = 300
+# Filas 'en_proceso' más viejas que esto se consideran abandonadas
+_VENCIMIENTO_RECLAMO = timedelta(hours=1)
+
+
+def _ruta_por_defecto() -> str:
+    base = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "GestorRegimen", "programados.db")
+
+
+def _iso(momento: datetime) -> str:
+    return momento.isoformat(timespec="seconds")
+
+
+class Informe(NamedTuple):
+    """Resultado de una pasada del programador (listas de CUIL)."""
+    aplicados: List[str]
+    sin_cambios: List[str]
+    no_encontrados: List[str]
+    reemplazados: List[str]
+    reintentos: List[str]
+    fallidos: List[str]
+
+    def resumen(self) -> str:
+        return (
+            f"Aplicados: {len(self.aplicados)}\n"
+            f"Ya correctos: {len(self.sin_cambios)}\n"
+            f"No encontrados: {len(self.no_encontrados)}\n"
+            f"Reemplazados por otro cambio: {len(self.reemplazados)}\n"
+            f"A reintentar: {len(self.reintentos)}\n"
+            f"Fallidos: {len(self.fallidos)}"
+        )
+
+
+class ColaProgramada:
+    """Cola persistente de cambios programados e informes de cada pasada."""
+
+    def __init__(self, ruta: Optional[str] = None) -> None:
+        self.ruta = ruta or _ruta_por_defecto()
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with closing(self._conectar()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cambios_programados (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cuil TEXT NOT NULL,
+                    regimen INTEGER NOT NULL,
+                    fecha_efectiva TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    proximo_intento TEXT,
+                    ultimo_error TEXT,
+                    creado TEXT NOT NULL,
+                    procesado TEXT,
+                    reclamado TEXT
+                )
+                """
+            )
+            columnas = {f["name"] for f in conn.execute("PRAGMA table_info(cambios_programados)")}
+            if "reclamado" not in columnas:
+                conn.execute("ALTER TABLE cambios_programados ADD COLUMN reclamado TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_pendientes "
+                "ON cambios_programados (estado, fecha_efectiva, id)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS informes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    inicio TEXT NOT NULL,
+                    fin TEXT NOT NULL,
+                    detalle TEXT NOT NULL
+                )
+                """
+            )
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def programar(self, cuil: str, regimen: int, fecha_efectiva: date) -> int:
+        with closing(self._conectar()) as conn:
+            cur = conn.execute(
+                "INSERT INTO cambios_programados (cuil, regimen, fecha_efectiva, creado) VALUES (?, ?, ?, ?)",
+                (cuil, regimen, fecha_efectiva.isoformat(), _iso(datetime.now())),
+            )
+            return int(cur.lastrowid)
+
+    def reclamar(self, ahora: datetime, limite: int) -> Tuple[List[sqlite3.Row], List[str]]:
+        """
+        Toma hasta ``limite`` cambios vencidos y los marca 'en_proceso' en la
+        misma transacción, para que otra instancia no procese los mismos.
+
+        Antes marca 'reemplazado' todo cambio sin aplicar de un CUIL que ya
+        tiene uno posterior aplicado o también vencido, para que un reintento
+        viejo no pise al más nuevo. Devuelve las filas tomadas y los CUIL de
+        los reemplazados.
+        """
+        reclamable = "(c.estado = 'pendiente' OR (c.estado = 'en_proceso' AND c.reclamado <= :abandono))"
+        parametros = {
+            "abandono": _iso(ahora - _VENCIMIENTO_RECLAMO),
+            "hoy": ahora.date().isoformat(),
+            "ahora": _iso(ahora),
+            "limite": limite,
+        }
+        with closing(self._conectar()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                reemplazados = conn.execute(
+                    f"""
+                    SELECT c.id, c.cuil
+                    FROM cambios_programados AS c
+                    WHERE {reclamable}
+                      AND EXISTS (
+                          SELECT 1 FROM cambios_programados AS n
+                          WHERE n.cuil = c.cuil
+                            AND (n.fecha_efectiva > c.fecha_efectiva
+                                 OR (n.fecha_efectiva = c.fecha_efectiva AND n.id > c.id))
+                            AND (n.estado IN ('aplicado', 'sin_cambios')
+                                 OR (n.estado IN ('pendiente', 'en_proceso') AND n.fecha_efectiva <= :hoy))
+                      )
+                    """,
+                    parametros,
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE cambios_programados SET estado = 'reemplazado', procesado = ?, "
+                    "ultimo_error = NULL WHERE id = ?",
+                    [(_iso(ahora), f["id"]) for f in reemplazados],
+                )
+                filas = conn.execute(
+                    f"""
+                    SELECT c.id, c.cuil, c.regimen, c.fecha_efectiva, c.intentos
+                    FROM cambios_programados AS c
+                    WHERE {reclamable}
+                      AND c.fecha_efectiva <= :hoy
+                      AND (c.proximo_intento IS NULL OR c.proximo_intento <= :ahora)
+                    ORDER BY c.fecha_efectiva, c.id
+                    LIMIT :limite
+                    """,
+                    parametros,
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE cambios_programados SET estado = 'en_proceso', reclamado = ? WHERE id = ?",
+                    [(_iso(ahora), f["id"]) for f in filas],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return filas, [f["cuil"] for f in reemplazados]
+
+    def marcar(self, ids: Sequence[int], estado: str, ahora: datetime) -> None:
+        with closing(self._conectar()) as conn, conn:
+            conn.executemany(
+                "UPDATE cambios_programados SET estado = ?, procesado = ?, ultimo_error = NULL WHERE id = ?",
+                [(estado, _iso(ahora), i) for i in ids],
+            )
+
+    def liberar(self, ids: Sequence[int]) -> None:
+        """Devuelve a 'pendiente' filas reclamadas que no se llegaron a procesar."""
+        with closing(self._conectar()) as conn, conn:
+            conn.executemany(
+                "UPDATE cambios_programados SET estado = 'pendiente' WHERE id = ? AND estado = 'en_proceso'",
+                [(i,) for i in ids],
+            )
+
+    def reintentar(self, filas: Sequence[sqlite3.Row], error: str, ahora: datetime) -> List[int]:
+        """Suma un intento; devuelve los ids que agotaron los reintentos."""
+        fallidos: List[int] = []
+        with closing(self._conectar()) as conn, conn:
+            for fila in filas:
+                intentos = fila["intentos"] + 1
+                if intentos >= _MAX_INTENTOS:
+                    fallidos.append(fila["id"])
+                    conn.execute(
+                        "UPDATE cambios_programados SET estado = 'fallido', intentos = ?, "
+                        "ultimo_error = ?, procesado = ? WHERE id = ?",
+                        (intentos, error, _iso(ahora), fila["id"]),
+                    )
+                else:
+                    espera = timedelta(minutes=_ESPERA_REINTENTO_MIN * 2 ** (intentos - 1))
+                    conn.execute(
+                        "UPDATE cambios_programados SET estado = 'pendiente', intentos = ?, "
+                        "ultimo_error = ?, proximo_intento = ? WHERE id = ?",
+                        (intentos, error, _iso(ahora + espera), fila["id"]),
+                    )
+        return fallidos
+
+    def guardar_informe(self, informe: Informe, inicio: datetime, fin: datetime) -> None:
+        with closing(self._conectar()) as conn, conn:
+            conn.execute(
+                "INSERT INTO informes (inicio, fin, detalle) VALUES (?, ?, ?)",
+                (_iso(inicio), _iso(fin), json.dumps(informe._asdict())),
+            )
+
+    def ultimo_informe(self) -> Optional[Tuple[str, Informe]]:
+        """Fecha de fin e informe de la última pasada, si hubo alguna."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT fin, detalle FROM informes ORDER BY id DESC LIMIT 1").fetchone()
+        if fila is None:
+            return None
+        return fila["fin"], Informe(**json.loads(fila["detalle"]))
+
+    def contar_pendientes(self, hoy: date) -> Tuple[int, int]:
+        """Cantidad de cambios pendientes y cuántos ya deberían haberse aplicado."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(fecha_efectiva <= ?), 0)
+                FROM cambios_programados
+                WHERE estado IN ('pendiente', 'en_proceso')
+                """,
+                (hoy.isoformat(),),
+            ).fetchone()
+        return int(fila[0]), int(fila[1])
+
+
+def en_ventana(ahora: datetime, inicio: dtime = VENTANA_INICIO, fin: dtime = VENTANA_FIN) -> bool:
+    hora = ahora.time()
+    if inicio <= fin:
+        return inicio <= hora < fin
+    return hora >= inicio or hora < fin
+
+
+def _base_caida(error: Exception) -> bool:
+    """
+    Errores de conexión (SQLSTATE 08xxx): no tiene sentido dividir el lote,
+    falla todo. Un timeout de consulta (HYT00) suele ser una fila bloqueada y
+    se aísla dividiendo como cualquier otro error.
+    """
+    if isinstance(error, ConnectionError):
+        return True
+    estado = str(error.args[0]) if error.args else ""
+    return estado.startswith("08")
+
+
+def aplicar_vencidos(
+    cola: ColaProgramada,
+    conectar: Conectar = obtener_conexion,
+    ahora: Optional[datetime] = None,
+    tamanio_lote: int = _TAMANIO_LOTE,
+    respetar_ventana: bool = False,
+) -> Informe:
+    """
+    Aplica los cambios vencidos en lotes, una transacción por lote. Si un lote
+    falla se divide a la mitad hasta aislar las filas con error, que quedan
+    para reintentar; el resto se aplica. Con ``respetar_ventana`` se detiene
+    al cerrar la ventana horaria y devuelve lo no procesado a la cola.
+    Guarda el informe en la cola.
+    """
+    inicio = datetime.now()
+    ahora = ahora or inicio
+    informe = Informe([], [], [], [], [], [])
+    detenido = False
+    while not detenido:
+        filas, reemplazados = cola.reclamar(ahora, tamanio_lote)
+        informe.reemplazados.extend(reemplazados)
+        if not filas:
+            break
+        print(f"[*] Lote programado: {len(filas)} CUIL ({len(reemplazados)} reemplazados).")
+
+        grupos: List[List[sqlite3.Row]] = [filas]
+        while grupos:
+            grupo = grupos.pop()
+            if respetar_ventana and not en_ventana(datetime.now()):
+                print("[*] Se cerró la ventana horaria. Lo no procesado vuelve a la cola.")
+                cola.liberar([f["id"] for g in grupos + [grupo] for f in g])
+                detenido = True
+                break
+            try:
+                vista = previsualizar_cambios({f["cuil"]: f["regimen"] for f in grupo}, conectar)
+                aplicar_cambios(vista, conectar)
+            except (pyodbc.Error, ConnectionError) as e:
+                if len(grupo) > 1 and not _base_caida(e):
+                    mitad = len(grupo) // 2
+                    grupos.extend((grupo[mitad:], grupo[:mitad]))
+                    continue
+                print(f"[!] Falló el cambio programado ({len(grupo)} CUIL): {e}")
+                pendientes = grupo
+                if _base_caida(e):
+                    # La base no responde: todo lo que queda se reintenta después
+                    detenido = True
+                    pendientes = grupo + [f for g in grupos for f in g]
+                    grupos = []
+                fallidos = set(cola.reintentar(pendientes, str(e), ahora))
+                for f in pendientes:
+                    (informe.fallidos if f["id"] in fallidos else informe.reintentos).append(f["cuil"])
+                continue
+            except Exception:
+                cola.liberar([f["id"] for g in grupos + [grupo] for f in g])
+                raise
+
+            por_cuil = {f["cuil"]: f["id"] for f in grupo}
+            cola.marcar([por_cuil[c] for c in vista.a_cambiar], "aplicado", ahora)
+            cola.marcar([por_cuil[c] for c in vista.sin_cambios], "sin_cambios", ahora)
+            cola.marcar([por_cuil[c] for c in vista.no_encontrados], "no_encontrado", ahora)
+            informe.aplicados.extend(vista.a_cambiar)
+            informe.sin_cambios.extend(vista.sin_cambios)
+            informe.no_encontrados.extend(vista.no_encontrados)
+
+        if len(filas) < tamanio_lote:
+            break
+
+    if any(informe):
+        cola.guardar_informe(informe, inicio, datetime.now())
+    return informe
+
+
+class Programador:
+    """Hilo que cada ``intervalo`` segundos aplica lo vencido si está en la ventana."""
+
+    def __init__(
+        self,
+        cola: ColaProgramada,
+        intervalo: float = 300.0,
+        conectar: Conectar = obtener_conexion,
+    ) -> None:
+        self.cola = cola
+        self.intervalo = intervalo
+        self.conectar = conectar
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self) -> None:
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+            self._hilo = None
+
+    def _ciclo(self) -> None:
+        while not self._detener.wait(self.intervalo):
+            if not en_ventana(datetime.now()):
+                continue
+            try:
+                informe = aplicar_vencidos(self.cola, self.conectar, respetar_ventana=True)
+            except Exception as e:
+                print(f"[!] Error inesperado en el programador: {e}")
+                continue
+            if any(informe):
+                print("[+] Cambios programados procesados:\n" + informe.resumen())
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Aplica los cambios de régimen programados.")
+    parser.add_argument("--cola", help="Ruta del archivo de la cola (por defecto en LOCALAPPDATA)")
+    parser.add_argument("--forzar", action="store_true", help="Aplicar aunque esté fuera de la ventana horaria")
+    args = parser.parse_args(argv)
+
+    if not args.forzar and not en_ventana(datetime.now()):
+        print(f"[*] Fuera de la ventana {VENTANA_INICIO:%H:%M}-{VENTANA_FIN:%H:%M}. No se aplica nada.")
+        return
+    cola = ColaProgramada(args.cola)
+    # Sin --forzar sigue dentro de la ventana mientras queden vencidos, para
+    # que los reintentos (15, 30, 60... minutos) ocurran la misma noche.
+    while True:
+        informe = aplicar_vencidos(cola, respetar_ventana=not args.forzar)
+        print(informe.resumen())
+        for titulo, cuils in (("Aplicados", informe.aplicados), ("Fallidos", informe.fallidos)):
+            if cuils:
+                print(f"{titulo}: {', '.join(cuils)}")
+        if args.forzar:
+            return
+        _, vencidos = cola.contar_pendientes(date.today())
+        if not vencidos:
+            return
+        print(f"[*] Quedan {vencidos} cambio(s) vencidos. Próxima pasada en {_INTERVALO_PASADA_SEG // 60} min.")
+        time.sleep(_INTERVALO_PASADA_SEG)
+        if not en_ventana(datetime.now()):
+            print("[*] Se cerró la ventana horaria.")
+            return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Prueba de carga: N empleados virtuales consultando y guardando regímenes
+en paralelo, con el mismo código que usa ``MainWindow`` (sin interfaz).
+
+El backend simulado reemplaza a ``pyodbc.connect`` debajo de
+``Modules.conexion_db``, así que se ejercitan el recorrido de drivers, la
+medición de retraso, la suspensión de la réplica y el límite de conexiones
+reales de la aplicación. Cada empleado virtual tiene su propio estado de
+conexión (límite, réplica, retraso y escrituras propias), como cada
+GestorRegimen.exe. El backend modela la capacidad de cada servidor: una
+cantidad fija de workers y una latencia que crece con las solicitudes en
+curso, además de bloqueos por fila. Informa rendimiento, percentiles de
+latencia y tasa de errores por nivel de concurrencia.
+
+    python -m Modules.prueba_carga --clientes 1,10,25,50 --pool 10
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import random
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+import pyodbc
+
+from Modules import conexion_db
+from Modules.operaciones_regimen import aplicar_cambios, consultar_persona, previsualizar_cambios
+
+
+class BackendSimulado:
+    """
+    Reemplazo local de SQL01 con la firma de ``pyodbc.connect``. Primario y
+    réplica tienen ``trabajadores`` workers cada uno; cada login, consulta o
+    commit ocupa uno y su latencia base se multiplica por
+    ``1 + en curso / trabajadores``. Cada cambio de régimen bloquea la fila
+    del CUIL hasta el commit; la espera por el bloqueo está limitada por el
+    timeout de consulta de la conexión.
+    """
+
+    def __init__(
+        self,
+        cuils: int = 500,
+        latencia: float = 0.010,
+        latencia_escritura: float = 0.030,
+        latencia_login: float = 0.005,
+        replica: str = "ok",
+        trabajadores: int = 32,
+    ) -> None:
+        self.cuils = [f"20{n:08d}1" for n in range(cuils)]
+        self.regimenes: Dict[str, int] = {c: random.choice((1, 2, 3)) for c in self.cuils}
+        self.bloqueos: Dict[str, threading.Lock] = {c: threading.Lock() for c in self.cuils}
+        self.latencia = latencia
+        self.latencia_escritura = latencia_escritura
+        self.latencia_login = latencia_login
+        self.replica = replica  # "ok", "atrasada" o "caida"
+        self.trabajadores = trabajadores
+        self.workers = {s: threading.Semaphore(trabajadores) for s in ("replica", "primario")}
+        self.en_curso = {"replica": 0, "primario": 0}
+        self.pico = {"replica": 0, "primario": 0}
+        self.conexiones = {"replica": 0, "primario": 0}
+        self._lock = threading.Lock()
+
+    def demora(self, base: float) -> None:
+        time.sleep(max(0.0, random.gauss(base, base / 4)))
+
+    def atender(self, servidor: str, base: float) -> None:
+        """Espera un worker libre de ``servidor`` y ocupa el tiempo de la solicitud."""
+        with self._lock:
+            self.en_curso[servidor] += 1
+            self.pico[servidor] = max(self.pico[servidor], self.en_curso[servidor])
+        try:
+            with self.workers[servidor]:
+                with self._lock:
+                    carga = self.en_curso[servidor] / self.trabajadores
+                self.demora(base * (1 + carga))
+        finally:
+            with self._lock:
+                self.en_curso[servidor] -= 1
+
+    def connect(self, conn_str: str, timeout: int = 0, **_: Any) -> "_ConexionSimulada":
+        es_replica = "ApplicationIntent=ReadOnly" in conn_str
+        if es_replica and self.replica == "caida":
+            # La réplica no responde: se agota el timeout de login
+            time.sleep(timeout)
+            raise pyodbc.Error("HYT00", "Login timeout expired")
+        servidor = "replica" if es_replica else "primario"
+        self.atender(servidor, self.latencia_login)
+        with self._lock:
+            self.conexiones[servidor] += 1
+        return _ConexionSimulada(self, servidor)
+
+
+class _ConexionSimulada:
+    def __init__(self, backend: BackendSimulado, servidor: str) -> None:
+        self.backend = backend
+        self.servidor = servidor
+        self.bloqueados: List[str] = []
+        self.pendientes: Dict[str, int] = {}
+        self.timeout = 0
+        self.autocommit = False
+
+    def cursor(self) -> "_CursorSimulado":
+        return _CursorSimulado(self)
+
+    def _liberar(self) -> None:
+        for cuil in self.bloqueados:
+            self.backend.bloqueos[cuil].release()
+        self.bloqueados.clear()
+        self.pendientes.clear()
+
+    def commit(self) -> None:
+        self.backend.atender(self.servidor, self.backend.latencia_escritura)
+        self.backend.regimenes.update(self.pendientes)
+        self._liberar()
+
+    def rollback(self) -> None:
+        self._liberar()
+
+    def close(self) -> None:
+        self._liberar()
+
+
+class _CursorSimulado:
+    def __init__(self, conn: _ConexionSimulada) -> None:
+        self.conn = conn
+        self.filas: List[Any] = []
+
+    def execute(self, sql: str, *params) -> "_CursorSimulado":
+        backend = self.conn.backend
+        backend.atender(self.conn.servidor, backend.latencia)
+        cuil = params[0] if params else None
+        if "Anto_RetrasoReplica" in sql:
+            self.filas = [(120 if backend.replica == "atrasada" else 0,)]
+        elif "Anto_ObtenerPersonaPorCUIL" in sql:
+            existe = cuil in backend.regimenes
+            self.filas = [SimpleNamespace(Apeynom=f"PERSONA {cuil}", Fec_nac=date(1980, 1, 1))] if existe else []
+        elif "anto_regimenactual" in sql:
+            reg = self.conn.pendientes.get(cuil, backend.regimenes.get(cuil))
+            self.filas = [SimpleNamespace(REGIMEN=reg)] if reg is not None else []
+        elif "Anto_RegimenesPorCUIL" in sql:
+            self.filas = [
+                SimpleNamespace(CUIL=c, REGIMEN=backend.regimenes[c])
+                for c in set(cuil.split(",")) if c in backend.regimenes
+            ]
+        elif "Anto_CambiarRegimen" in sql:
+            if cuil not in self.conn.bloqueados:
+                espera = self.conn.timeout if self.conn.timeout else -1
+                if not backend.bloqueos[cuil].acquire(timeout=espera):
+                    raise pyodbc.Error("HYT00", "Query timeout expired")
+                self.conn.bloqueados.append(cuil)
+            self.conn.pendientes[cuil] = int(params[1])
+            self.filas = []
+        else:
+            raise pyodbc.Error("42000", f"Consulta no soportada por el backend simulado: {sql}")
+        return self
+
+    def executemany(self, sql: str, filas: Sequence[Sequence]) -> None:
+        for fila in filas:
+            self.execute(sql, *fila)
+
+    def fetchone(self) -> Any:
+        return self.filas.pop(0) if self.filas else None
+
+    def fetchall(self) -> List[Any]:
+        filas, self.filas = self.filas, []
+        return filas
+
+
+def _percentil(valores: Sequence[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def _empleado(
+    backend: BackendSimulado,
+    fin: float,
+    proporcion_guardado: float,
+    pausa: float,
+    latencias: Dict[str, List[float]],
+    errores: Dict[str, int],
+    lock: threading.Lock,
+) -> None:
+    """Un empleado virtual: busca un CUIL y a veces guarda un régimen, como en la ventana."""
+    # Cada empleado es un GestorRegimen.exe distinto: no comparte límite,
+    # estado de la réplica ni escrituras propias con los demás.
+    conexion_db.aislar_hilo()
+    while time.monotonic() < fin:
+        cuil = random.choice(backend.cuils)
+        guardar = random.random() < proporcion_guardado
+        tipo = "guardado" if guardar else "consulta"
+        inicio = time.perf_counter()
+        try:
+            if guardar:
+                # Igual que MainWindow: previsualiza y solo escribe si cambia
+                vista = previsualizar_cambios({cuil: random.choice((1, 2, 3))})
+                aplicar_cambios(vista)
+            else:
+                consultar_persona(cuil)
+            with lock:
+                latencias[tipo].append(time.perf_counter() - inicio)
+        except (pyodbc.Error, ConnectionError):
+            with lock:
+                errores[tipo] += 1
+        if pausa:
+            backend.demora(pausa)
+
+
+def ejecutar_nivel(
+    backend: BackendSimulado,
+    clientes: int,
+    duracion: float,
+    proporcion_guardado: float,
+    pausa: float,
+) -> Dict[str, Dict[str, float]]:
+    """Corre ``clientes`` empleados durante ``duracion`` segundos y resume resultados."""
+    latencias: Dict[str, List[float]] = {"consulta": [], "guardado": []}
+    errores: Dict[str, int] = {"consulta": 0, "guardado": 0}
+    lock = threading.Lock()
+    fin = time.monotonic() + duracion
+    hilos = [
+        threading.Thread(
+            target=_empleado,
+            args=(backend, fin, proporcion_guardado, pausa, latencias, errores, lock),
+            daemon=True,
+        )
+        for _ in range(clientes)
+    ]
+    inicio = time.perf_counter()
+    # Los SP imprimen cada paso; se descarta para no medir la consola
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+    transcurrido = time.perf_counter() - inicio
+
+    resumen: Dict[str, Dict[str, float]] = {}
+    for tipo, valores in latencias.items():
+        total = len(valores) + errores[tipo]
+        resumen[tipo] = {
+            "ops_s": len(valores) / transcurrido,
+            "p50": _percentil(valores, 50) * 1000,
+            "p95": _percentil(valores, 95) * 1000,
+            "p99": _percentil(valores, 99) * 1000,
+            "errores_pct": 100.0 * errores[tipo] / total if total else 0.0,
+        }
+    return resumen
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Prueba de carga del Gestor de Régimen.")
+    parser.add_argument("--clientes", default="1,5,10,25,50", help="Niveles de concurrencia, separados por coma")
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por nivel")
+    parser.add_argument("--guardado", type=float, default=0.2, help="Proporción de operaciones que guardan")
+    parser.add_argument("--pausa", type=float, default=0.05, help="Pausa media entre operaciones (s)")
+    parser.add_argument("--cuils", type=int, default=500, help="CUILs distintos (menos = más contención)")
+    parser.add_argument("--latencia", type=float, default=0.010, help="Latencia media por consulta (s)")
+    parser.add_argument("--latencia-escritura", type=float, default=0.030, help="Latencia media del commit (s)")
+    parser.add_argument("--latencia-login", type=float, default=0.005, help="Latencia media del login (s)")
+    parser.add_argument("--replica", choices=("ok", "atrasada", "caida"), default="ok", help="Estado de la réplica")
+    parser.add_argument("--trabajadores", type=int, default=32, help="Workers por servidor (primario y réplica)")
+    # Configuración real de Modules/conexion_db.py
+    parser.add_argument("--pool", type=int, default=conexion_db._MAX_CONEXIONES, help="_MAX_CONEXIONES")
+    parser.add_argument("--espera-pool", type=float, default=conexion_db._ESPERA_POOL_SEG, help="_ESPERA_POOL_SEG")
+    parser.add_argument(
+        "--timeout-conexion", type=int, default=conexion_db._TIMEOUT_CONEXION_SEG, help="_TIMEOUT_CONEXION_SEG"
+    )
+    parser.add_argument(
+        "--timeout-consulta", type=int, default=conexion_db._TIMEOUT_CONSULTA_SEG, help="_TIMEOUT_CONSULTA_SEG"
+    )
+    parser.add_argument(
+        "--timeout-replica", type=int, default=conexion_db._TIMEOUT_CONEXION_REPLICA_SEG,
+        help="_TIMEOUT_CONEXION_REPLICA_SEG",
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"Pool={args.pool} espera={args.espera_pool}s login={args.timeout_conexion}s "
+        f"login réplica={args.timeout_replica}s "
+        f"consulta={args.timeout_consulta}s réplica={args.replica} workers={args.trabajadores} CUILs={args.cuils} "
+        f"guardado={args.guardado:.0%}"
+    )
+    print(
+        f"{'clientes':>8} {'tipo':>9} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'error %':>8} {'réplica %':>10} {'pico prim':>10} {'pico répl':>10}"
+    )
+    for clientes in (int(n) for n in args.clientes.split(",")):
+        backend = BackendSimulado(
+            cuils=args.cuils,
+            latencia=args.latencia,
+            latencia_escritura=args.latencia_escritura,
+            latencia_login=args.latencia_login,
+            replica=args.replica,
+            trabajadores=args.trabajadores,
+        )
+        conexion_db.configurar(
+            max_conexiones=args.pool,
+            espera_pool=args.espera_pool,
+            timeout_conexion=args.timeout_conexion,
+            timeout_consulta=args.timeout_consulta,
+            timeout_replica=args.timeout_replica,
+            conector=backend.connect,
+        )
+        resumen = ejecutar_nivel(backend, clientes, args.duracion, args.guardado, args.pausa)
+        total = sum(backend.conexiones.values())
+        en_replica = 100.0 * backend.conexiones["replica"] / total if total else 0.0
+        for tipo, r in resumen.items():
+            print(
+                f"{clientes:>8} {tipo:>9} {r['ops_s']:>8.1f} {r['p50']:>8.1f} "
+                f"{r['p95']:>8.1f} {r['p99']:>8.1f} {r['errores_pct']:>8.2f} {en_replica:>10.1f} "
+                f"{backend.pico['primario']:>10} {backend.pico['replica']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
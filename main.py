@@ -6,36 +6,69 @@ Gestor de Régimen – PyQt5
 
 import os
 import sys
+import threading
 import pyodbc
 from typing import Dict, Optional
 
 from PyQt5.QtWidgets import (
     QApplication,
     QVBoxLayout,
+    QHBoxLayout,
     QLabel,
     QLineEdit,
+    QListWidget,
+    QListWidgetItem,
     QComboBox,
+    QDateEdit,
     QPushButton,
     QMessageBox,
     QDesktopWidget,
+    QFileDialog,
 )
+from PyQt5.QtCore import QDate, Qt, pyqtSignal
 from PyQt5.QtGui import QIcon
 
 from Modules.style import RoundedWindow
 from Modules.resources import ICON_PATH
-from Modules.conexion_db import obtener_conexion
+from Modules.conexion_db import ConexionLimitada, obtener_conexion
+from Modules.operaciones_regimen import (
+    aplicar_cambios,
+    consultar_persona,
+    leer_archivo_cambios,
+    previsualizar_cambios,
+)
+from Modules.cambios_regimen import SondeoCambios
+from Modules.programador import ColaProgramada, Programador
+from Modules.busqueda_nombres import (
+    PAGINA_NOMBRES,
+    IndiceNombres,
+    Resultado,
+    buscar_en_servidor,
+)
 
 # ────────────────────────────────────────────────────────────────
 REGIMENES: Dict[int, str] = {1: "Docentes", 2: "Régimen Común", 3: "Régimen Policial"}
+# Carga los nombres de Personas en memoria al iniciar (búsqueda sin acentos)
+INDICE_LOCAL_NOMBRES = False
+# Cada cuántos segundos se consultan los cambios hechos por otros usuarios
+INTERVALO_CAMBIOS_SEG = 5.0
+# Actualiza el régimen mostrado cuando otro usuario lo cambia (Change Tracking)
+CAMBIOS_EN_VIVO = True
+# Aplica los cambios programados vencidos mientras la aplicación está abierta.
+# Desactivado: la ruta por defecto es la tarea programada (--aplicar-programados)
+PROGRAMADOR_EN_APP = False
 # ────────────────────────────────────────────────────────────────
 
 
 class MainWindow(RoundedWindow):
+    # Emitida desde el hilo de sondeo; Qt la entrega en el hilo de la ventana
+    cambios_recibidos = pyqtSignal(dict)
+
     def __init__(self) -> None:
         super().__init__()
 
         self.setWindowTitle("Gestión de Régimen")
-        self.setFixedSize(340, 380)
+        self.setFixedSize(340, 760)
 
         # Ícono
         if os.path.exists(ICON_PATH):
@@ -55,6 +88,35 @@ class MainWindow(RoundedWindow):
         btn_buscar.clicked.connect(self.buscar_persona)
         layout.addWidget(btn_buscar)
 
+        # Búsqueda por nombre
+        layout.addWidget(QLabel("Buscar por nombre:"))
+        fila_nombre = QHBoxLayout()
+        self.nombre_input = QLineEdit()
+        self.nombre_input.setPlaceholderText("Apellido y/o nombre")
+        self.nombre_input.returnPressed.connect(self.buscar_por_nombre)
+        fila_nombre.addWidget(self.nombre_input)
+        btn_nombre = QPushButton("Buscar")
+        btn_nombre.clicked.connect(self.buscar_por_nombre)
+        fila_nombre.addWidget(btn_nombre)
+        layout.addLayout(fila_nombre)
+
+        self.resultados_list = QListWidget()
+        self.resultados_list.itemClicked.connect(self.seleccionar_resultado)
+        layout.addWidget(self.resultados_list)
+
+        self.btn_mas = QPushButton("Más resultados")
+        self.btn_mas.setEnabled(False)
+        self.btn_mas.clicked.connect(self.mas_resultados)
+        layout.addWidget(self.btn_mas)
+
+        self._patron_nombre = ""
+        self._ultimo_resultado: Optional[Resultado] = None
+        # Origen fijado al iniciar cada búsqueda para que el paginado sea coherente
+        self._busqueda_local = False
+        self.indice = IndiceNombres()
+        if INDICE_LOCAL_NOMBRES:
+            threading.Thread(target=self._construir_indice, daemon=True).start()
+
         # Etiquetas (fucsia) + valores (blanco)
         self.nom_tag = QLabel("Nombre:");              self.nom_tag.setObjectName("etiqueta")
         self.nom_val = QLabel("")
@@ -82,6 +144,42 @@ class MainWindow(RoundedWindow):
         btn_guardar.clicked.connect(self.guardar_regimen)
         layout.addWidget(btn_guardar)
 
+        # Cambio programado con fecha de vigencia
+        fila_programar = QHBoxLayout()
+        self.fecha_input = QDateEdit(QDate.currentDate().addDays(1))
+        self.fecha_input.setCalendarPopup(True)
+        self.fecha_input.setMinimumDate(QDate.currentDate().addDays(1))
+        fila_programar.addWidget(self.fecha_input)
+        btn_programar = QPushButton("Programar")
+        btn_programar.clicked.connect(self.programar_regimen)
+        fila_programar.addWidget(btn_programar)
+        layout.addLayout(fila_programar)
+        fila_informe = QHBoxLayout()
+        self.programados_val = QLabel("")
+        fila_informe.addWidget(self.programados_val)
+        btn_informe = QPushButton("Informe")
+        btn_informe.clicked.connect(self.ver_informe_programados)
+        fila_informe.addWidget(btn_informe)
+        layout.addLayout(fila_informe)
+
+        # Cambio masivo desde CSV
+        btn_masivo = QPushButton("Cambio masivo…")
+        btn_masivo.clicked.connect(self.cambio_masivo)
+        layout.addWidget(btn_masivo)
+
+        # Cambios de otros usuarios
+        self._cuil_mostrado: Optional[str] = None
+        self.cambios_recibidos.connect(self._aplicar_cambios)
+        self.sondeo = SondeoCambios(self.cambios_recibidos.emit, INTERVALO_CAMBIOS_SEG)
+        if CAMBIOS_EN_VIVO:
+            self.sondeo.iniciar()
+
+        self.cola = ColaProgramada()
+        self.programador = Programador(self.cola)
+        if PROGRAMADOR_EN_APP:
+            self.programador.iniciar()
+        self._actualizar_programados()
+
     # ───────── Utilidades ─────────
     @staticmethod
     def _cuil_valido(cuil: str) -> bool:
@@ -95,6 +193,36 @@ class MainWindow(RoundedWindow):
     ) -> None:
         QMessageBox(icon, titulo, mensaje, parent=self).exec()
 
+    def _mostrar_regimen(self, reg_id: Optional[int]) -> None:
+        if reg_id is not None:
+            self.reg_val.setText(f"{reg_id} – {REGIMENES.get(reg_id, 'Desconocido')}")
+        else:
+            self.reg_val.setText("No encontrado")
+
+    def _aplicar_cambios(self, cambios: Dict[str, Optional[int]]) -> None:
+        print(f"[*] Cambios de régimen recibidos: {len(cambios)}")
+        if self._cuil_mostrado in cambios:
+            print(f"[*] Actualizando régimen mostrado del CUIL {self._cuil_mostrado}.")
+            self._mostrar_regimen(cambios[self._cuil_mostrado])
+
+    def _actualizar_programados(self) -> None:
+        try:
+            pendientes, vencidos = self.cola.contar_pendientes(QDate.currentDate().toPyDate())
+        except Exception as e:
+            print(f"[!] No se pudo leer la cola de cambios programados: {e}")
+            self.programados_val.setText("Programados: sin datos")
+            return
+        texto = f"Programados: {pendientes}"
+        if vencidos:
+            # Vencidos sin aplicar: la tarea programada no corrió o falló
+            texto += f" ({vencidos} vencidos sin aplicar)"
+        self.programados_val.setText(texto)
+
+    def closeEvent(self, event) -> None:
+        self.sondeo.detener()
+        self.programador.detener()
+        super().closeEvent(event)
+
     # ───────── Consultas ─────────
     def buscar_persona(self) -> None:
         cuil = self.cuil_input.text().strip()
@@ -107,45 +235,27 @@ class MainWindow(RoundedWindow):
             print("-" * 72 + "\n")
             return
 
-        conn: Optional[pyodbc.Connection] = None
         try:
-            print("[*] Obteniendo conexión a la base de datos...")
-            conn = obtener_conexion()
-            cur = conn.cursor()
-
-            # Datos personales
-            sp_persona = "Aportes.dbo.Anto_ObtenerPersonaPorCUIL"
-            print(f"[*] Ejecutando SP de datos personales: {sp_persona} con CUIL: {cuil}")
-            cur.execute(f"EXEC {sp_persona} @CUIL = ?", cuil)
-            p = cur.fetchone()
-            print(f"[*] Resultado SP datos personales: {'Encontrado' if p else 'No encontrado'}")
-
-            if p:
+            datos = consultar_persona(cuil)
+
+            if datos["encontrado"]:
                 fec_txt = "No disponible"
+                fec_nac = datos["fec_nac"]
                 try:
-                    if getattr(p, "Fec_nac", None):
-                        fec_txt = p.Fec_nac.strftime("%d/%m/%Y")
+                    if fec_nac:
+                        fec_txt = fec_nac.strftime("%d/%m/%Y")
                 except Exception as e:
-                    fec_txt = str(p.Fec_nac)
-                    print(f"[!] Advertencia: No se pudo formatear la fecha de nacimiento. Valor: {p.Fec_nac}. Error: {e}")
-                self.nom_val.setText(getattr(p, "Apeynom", ""))
+                    fec_txt = str(fec_nac)
+                    print(f"[!] Advertencia: No se pudo formatear la fecha de nacimiento. Valor: {fec_nac}. Error: {e}")
+                self.nom_val.setText(datos["apeynom"])
                 self.fn_val.setText(fec_txt)
             else:
                 self.nom_val.setText("No encontrado")
                 self.fn_val.setText("No disponible")
 
-            # Régimen actual
-            sp_regimen = "Aportes.dbo.anto_regimenactual"
-            print(f"[*] Ejecutando SP de régimen actual: {sp_regimen} con CUIL: {cuil}")
-            cur.execute(f"EXEC {sp_regimen} @CUIL = ?", cuil)
-            r = cur.fetchone()
-            print(f"[*] Resultado SP régimen: {'Encontrado' if r else 'No encontrado'}")
-
-            if r and getattr(r, "REGIMEN", None) is not None:
-                reg_id = int(r.REGIMEN)
-                self.reg_val.setText(f"{reg_id} – {REGIMENES.get(reg_id, 'Desconocido')}")
-            else:
-                self.reg_val.setText("No encontrado")
+            self._mostrar_regimen(datos["regimen"])
+            self._cuil_mostrado = cuil
+            self.sondeo.observar(cuil, datos["regimen"])
 
         except pyodbc.Error as e:
             print("\n" + "!"*29 + " ERROR DE BASE DE DATOS " + "!"*28)
@@ -160,14 +270,74 @@ class MainWindow(RoundedWindow):
             print("!"*78 + "\n")
             self.mostrar_mensaje("Error Inesperado", f"Ocurrió un error inesperado.\n\n{e}", QMessageBox.Critical)
         finally:
-            if conn is not None:
-                try:
-                    print("[*] Cerrando conexión a la base de datos.")
-                    conn.close()
-                except Exception as e:
-                    print(f"[!] Error al cerrar la conexión: {e}")
             print("-" * 28 + " FIN BÚSQUEDA " + "-" * 29 + "\n")
 
+    # ───────── Búsqueda por nombre ─────────
+    def _construir_indice(self) -> None:
+        try:
+            self.indice.construir(lambda: obtener_conexion(solo_lectura=True))
+        except Exception as e:
+            print(f"[!] No se pudo construir el índice local de nombres: {e}")
+
+    def buscar_por_nombre(self) -> None:
+        patron = self.nombre_input.text().strip()
+        if len(patron) < 2:
+            self.mostrar_mensaje("Error", "Ingrese al menos 2 letras del nombre.", QMessageBox.Warning)
+            return
+        self._patron_nombre = patron
+        self._ultimo_resultado = None
+        self._busqueda_local = self.indice.listo
+        self.resultados_list.clear()
+        self._cargar_pagina_nombres()
+
+    def mas_resultados(self) -> None:
+        self._cargar_pagina_nombres()
+
+    def _cargar_pagina_nombres(self) -> None:
+        print("\n" + "-"*24 + " INICIO BÚSQUEDA POR NOMBRE " + "-"*24)
+        print(f"[*] Nombre ingresado: {self._patron_nombre}")
+
+        filas: list = []
+        if self._busqueda_local:
+            print("[*] Buscando en el índice local...")
+            filas = self.indice.buscar(self._patron_nombre, self._ultimo_resultado)
+        else:
+            conn: Optional[ConexionLimitada] = None
+            try:
+                conn = obtener_conexion(solo_lectura=True)
+                filas = buscar_en_servidor(conn.cursor(), self._patron_nombre, self._ultimo_resultado)
+            except pyodbc.Error as e:
+                print(f"[!!!] Error de base de datos: {e.args}")
+                self.mostrar_mensaje("Error de Base de Datos", f"No se pudo buscar por nombre.\n\nError: {e}", QMessageBox.Critical)
+                print("-" * 25 + " FIN BÚSQUEDA POR NOMBRE " + "-" * 25 + "\n")
+                return
+            except Exception as e:
+                print(f"[!!!] Error inesperado: {e}")
+                self.mostrar_mensaje("Error Inesperado", f"Ocurrió un error inesperado.\n\n{e}", QMessageBox.Critical)
+                print("-" * 25 + " FIN BÚSQUEDA POR NOMBRE " + "-" * 25 + "\n")
+                return
+            finally:
+                if conn is not None:
+                    conn.close()
+
+        print(f"[*] Resultados: {len(filas)}")
+        for cuil, nombre in filas:
+            item = QListWidgetItem(f"{nombre} – {cuil}")
+            item.setData(Qt.UserRole, cuil)  # type: ignore[attr-defined]
+            self.resultados_list.addItem(item)
+        if filas:
+            self._ultimo_resultado = filas[-1]
+        elif self._ultimo_resultado is None:
+            self.resultados_list.addItem("Sin resultados")
+        self.btn_mas.setEnabled(len(filas) == PAGINA_NOMBRES)
+        print("-" * 25 + " FIN BÚSQUEDA POR NOMBRE " + "-" * 25 + "\n")
+
+    def seleccionar_resultado(self, item: QListWidgetItem) -> None:
+        cuil = item.data(Qt.UserRole)  # type: ignore[attr-defined]
+        if cuil:
+            self.cuil_input.setText(cuil)
+            self.buscar_persona()
+
     # ───────── Actualizar ─────────
     def guardar_regimen(self) -> None:
         cuil = self.cuil_input.text().strip()
@@ -183,25 +353,28 @@ class MainWindow(RoundedWindow):
             print("-" * 72 + "\n")
             return
 
-        conn: Optional[pyodbc.Connection] = None
         try:
-            print("[*] Obteniendo conexión a la base de datos...")
-            conn = obtener_conexion()
-            cur = conn.cursor()
-
-            sp_cambio = "Aportes.dbo.Anto_CambiarRegimen"
-            print(f"[*] Ejecutando SP de cambio de régimen: {sp_cambio}")
-            print(f"    - @CUIL = {cuil}")
-            print(f"    - @NuevoRegimen = {nuevo_regimen}")
-
-            cur.execute(f"EXEC {sp_cambio} @CUIL = ?, @NuevoRegimen = ?", cuil, nuevo_regimen)
-            print("[*] SP ejecutado. Realizando commit...")
-            conn.commit()
-            print("[+] Commit realizado con éxito.")
-
-            self.mostrar_mensaje("Éxito", "Régimen actualizado correctamente.")
-            print("[*] Actualización exitosa. Refrescando datos...")
-            self.buscar_persona()
+            vista = previsualizar_cambios({cuil: nuevo_regimen})
+            if vista.no_encontrados:
+                print("[!] El CUIL no tiene régimen registrado. No se guarda.")
+                self.mostrar_mensaje("Sin cambios", "El CUIL no tiene un régimen registrado.", QMessageBox.Warning)
+                return
+            if vista.sin_cambios:
+                print("[*] El régimen ya es el seleccionado. No se ejecuta el cambio.")
+                self.mostrar_mensaje("Sin cambios", "La persona ya tiene ese régimen.")
+                self._refrescar_guardado(cuil, nuevo_regimen)
+                return
+
+            anterior, _ = vista.a_cambiar[cuil]
+            aplicar_cambios(vista)
+
+            self._refrescar_guardado(cuil, nuevo_regimen)
+            self.mostrar_mensaje(
+                "Éxito",
+                "Régimen actualizado correctamente.\n\n"
+                f"{anterior} – {REGIMENES.get(anterior, 'Desconocido')}  →  "
+                f"{nuevo_regimen} – {REGIMENES.get(nuevo_regimen)}",
+            )
 
         except pyodbc.Error as e:
             print("\n" + "!"*29 + " ERROR DE BASE DE DATOS " + "!"*28)
@@ -216,14 +389,109 @@ class MainWindow(RoundedWindow):
             print("!"*78 + "\n")
             self.mostrar_mensaje("Error Inesperado", f"Ocurrió un error inesperado.\n\n{e}", QMessageBox.Critical)
         finally:
-            if conn is not None:
-                try:
-                    print("[*] Cerrando conexión a la base de datos.")
-                    conn.close()
-                except Exception as e:
-                    print(f"[!] Error al cerrar la conexión: {e}")
             print("-" * 26 + " FIN GUARDADO RÉGIMEN " + "-" * 26 + "\n")
 
+    def _refrescar_guardado(self, cuil: str, regimen: int) -> None:
+        """
+        Si el CUIL guardado es el que se está mostrando basta con actualizar el
+        régimen; si no (se escribió otro CUIL sin Buscar), se consulta completo.
+        """
+        if cuil == self._cuil_mostrado:
+            self._mostrar_regimen(regimen)
+            self.sondeo.observar(cuil, regimen)
+        else:
+            self.buscar_persona()
+
+    def programar_regimen(self) -> None:
+        cuil = self.cuil_input.text().strip()
+        nuevo_regimen = int(self.regimen_combo.currentData())
+        fecha = self.fecha_input.date().toPyDate()
+
+        print(f"[*] Programando régimen {nuevo_regimen} para CUIL {cuil} desde {fecha:%d/%m/%Y}")
+        if not self._cuil_valido(cuil):
+            print("[!] CUIL inválido.")
+            self.mostrar_mensaje("Error", "El CUIL debe tener 11 dígitos numéricos.", QMessageBox.Warning)
+            return
+
+        try:
+            self.cola.programar(cuil, nuevo_regimen, fecha)
+        except Exception as e:
+            print(f"[!!!] Error al programar el cambio: {e}")
+            self.mostrar_mensaje("Error Inesperado", f"No se pudo programar el cambio.\n\n{e}", QMessageBox.Critical)
+            return
+        self.mostrar_mensaje(
+            "Cambio programado",
+            f"{REGIMENES.get(nuevo_regimen)} a partir del {fecha:%d/%m/%Y}.\n"
+            "Se aplicará fuera del horario de oficina.",
+        )
+        self._actualizar_programados()
+
+    def ver_informe_programados(self) -> None:
+        self._actualizar_programados()
+        try:
+            ultimo = self.cola.ultimo_informe()
+        except Exception as e:
+            print(f"[!] No se pudo leer el informe de cambios programados: {e}")
+            self.mostrar_mensaje("Error Inesperado", f"No se pudo leer el informe.\n\n{e}", QMessageBox.Critical)
+            return
+        if ultimo is None:
+            self.mostrar_mensaje("Cambios programados", "Todavía no se procesó ningún cambio programado.")
+            return
+        fin, informe = ultimo
+        mensaje = f"Última pasada: {fin.replace('T', ' ')}\n\n{informe.resumen()}"
+        if informe.fallidos:
+            mensaje += "\n\nFallidos:\n" + "\n".join(informe.fallidos)
+        self.mostrar_mensaje(
+            "Cambios programados", mensaje,
+            QMessageBox.Warning if informe.fallidos else QMessageBox.Information,
+        )
+
+    def cambio_masivo(self) -> None:
+        ruta, _ = QFileDialog.getOpenFileName(self, "Archivo de cambios (CUIL;REGIMEN)", "", "CSV (*.csv *.txt)")
+        if not ruta:
+            return
+
+        print("\n" + "-"*26 + " INICIO CAMBIO MASIVO " + "-"*26)
+        print(f"[*] Archivo: {ruta}")
+        try:
+            cambios, descartadas = leer_archivo_cambios(ruta, REGIMENES)
+            print(f"[*] Cambios leídos: {len(cambios)} | Líneas descartadas: {len(descartadas)}")
+            if not cambios:
+                self.mostrar_mensaje("Cambio masivo", "El archivo no tiene líneas válidas.", QMessageBox.Warning)
+                return
+
+            vista = previsualizar_cambios(cambios)
+            resumen = vista.resumen()
+            if descartadas:
+                resumen += f"\nLíneas inválidas: {len(descartadas)}"
+            if not vista.a_cambiar:
+                self.mostrar_mensaje("Cambio masivo", f"No hay cambios para aplicar.\n\n{resumen}")
+                return
+
+            respuesta = QMessageBox.question(
+                self, "Confirmar cambio masivo", f"{resumen}\n\n¿Aplicar los cambios?",
+            )
+            if respuesta != QMessageBox.Yes:
+                print("[*] Cambio masivo cancelado por el usuario.")
+                return
+
+            aplicados = aplicar_cambios(vista)
+            for cuil, (_, nuevo) in vista.a_cambiar.items():
+                if cuil in self.sondeo.cache:
+                    self.sondeo.observar(cuil, nuevo)
+            if self._cuil_mostrado in vista.a_cambiar:
+                self._mostrar_regimen(vista.a_cambiar[self._cuil_mostrado][1])
+            self.mostrar_mensaje("Éxito", f"Se actualizaron {aplicados} régimen(es).")
+
+        except pyodbc.Error as e:
+            print(f"[!!!] Error de base de datos: {e.args}")
+            self.mostrar_mensaje("Error de Base de Datos", f"No se pudo aplicar el cambio masivo.\n\nError: {e}", QMessageBox.Critical)
+        except Exception as e:
+            print(f"[!!!] Error inesperado: {e}")
+            self.mostrar_mensaje("Error Inesperado", f"Ocurrió un error inesperado.\n\n{e}", QMessageBox.Critical)
+        finally:
+            print("-" * 27 + " FIN CAMBIO MASIVO " + "-" * 27 + "\n")
+
 
 def center_on_screen(window) -> None:
     """Centra la ventana en la pantalla principal."""
@@ -236,6 +504,12 @@ def center_on_screen(window) -> None:
 
 # ───────── Main ─────────
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--aplicar-programados"]:
+        # Modo tarea programada: sin ventana, aplica la cola y termina
+        from Modules.programador import main as aplicar_programados
+        aplicar_programados(sys.argv[2:])
+        sys.exit(0)
+
     app = QApplication(sys.argv)
     win = MainWindow()
     center_on_screen(win)  # ← Centrar antes de mostrar